@@ -0,0 +1,61 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+# --- Persistent Prompt -> Response Cache ---
+
+CACHE_PATH = os.environ.get("MCP_LLM_CACHE", ".llm_cache.sqlite3")
+
+# One connection per process, shared by Streamlit's session threads and serialised by the lock.
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+
+def _connection() -> sqlite3.Connection:
+    # Callers hold _lock; the schema is set up once, on first use.
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(CACHE_PATH, timeout=10, check_same_thread=False)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+        except sqlite3.Error:
+            conn.close()
+            raise
+        _conn = conn
+    return _conn
+
+def make_key(**fields) -> str:
+    payload = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get(key: str, ttl: Optional[float] = None) -> Optional[str]:
+    try:
+        with _lock:
+            row = _connection().execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error:
+        return None
+    if row is None:
+        return None
+    value, created_at = row
+    if ttl is not None and time.time() - created_at > ttl:
+        return None
+    return value
+
+def set(key: str, value: str) -> None:
+    try:
+        with _lock:
+            conn = _connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, value, time.time()),
+                )
+    except sqlite3.Error:
+        pass
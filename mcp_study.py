@@ -1,13 +1,23 @@
+import io
 import os
 import re
+import html
+import json
+import stat
+import string
 import pathlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
-from typing import List, Optional, Dict
+from typing import Any, Iterator, List, NamedTuple, Optional, Dict
 import configparser
 
-# LangChain & Pydantic Imports
+# Pydantic Imports
+# LangChain, markdown, graphviz and lxml are imported inside the functions that use
+# them to keep the app's cold start fast.
 from pydantic import BaseModel, Field
-from langchain_google_genai.chat_models import ChatGoogleGenerativeAI
+
+import llm_cache
 
 # --- Pydantic Models ---
 
@@ -23,218 +33,342 @@ class GeneratedCode(BaseModel):
     css: str = Field(description="The self-contained CSS code.")
     javascript: str = Field(description="The self-contained JavaScript code.")
 
+class TopicBundle(BaseModel):
+    explanation: str = Field(description="A Markdown-formatted explanation of the topic, including an 'Exam Prep' section.")
+    quiz: GeneratedCode = Field(description="A self-contained multiple-choice quiz for the topic.")
+    map_dot: str = Field(description="A Graphviz DOT string for a concept map of the topic.")
+    mnemonics: str = Field(description="Markdown-formatted mnemonics for the key concepts of the topic.")
+
+# Structured-output schemas, keyed by name so they can be used as cache keys.
+SCHEMAS = {
+    "ModuleTopics": ModuleTopics,
+    "GeneratedCode": GeneratedCode,
+    "TopicBundle": TopicBundle,
+}
+
 # --- Model Cache ---
 
+MODEL_NAME = "gemini-pro"
+TEMPERATURE = 0.7
+# Cached study bundles are regenerated after a week so content is not frozen forever.
+BUNDLE_CACHE_TTL = 7 * 24 * 3600
+
+@st.cache_resource(show_spinner=False)
+def _build_model(model_name: str):
+    from langchain_google_genai.chat_models import ChatGoogleGenerativeAI
+    api_key = os.environ.get('GOOGLE_API_KEY') or st.secrets.get("GOOGLE_API_KEY")
+    return ChatGoogleGenerativeAI(model=model_name, google_api_key=api_key, temperature=TEMPERATURE)
+
+class StructuredModel(NamedTuple):
+    runnable: Any
+    schema: type
+
+@st.cache_resource(show_spinner=False)
+def _build_structured(model_name: str, schema_id: str) -> StructuredModel:
+    schema = SCHEMAS[schema_id]
+    return StructuredModel(_build_model(model_name).with_structured_output(schema), schema)
+
+def _unwrap(model):
+    if isinstance(model, StructuredModel):
+        return model.runnable, model.schema
+    return model, None
+
 def get_gemini_model(structured_output_model=None, force_reinit=False):
-    model_key = 'gemini_model'
-    model_name = "gemini-pro"
-    if force_reinit and model_key in st.session_state:
-        del st.session_state[model_key]
-    if model_key not in st.session_state:
+    if force_reinit:
+        _build_model.clear()
+        _build_structured.clear()
+    try:
+        if structured_output_model:
+            return _build_structured(MODEL_NAME, structured_output_model.__name__)
+        return _build_model(MODEL_NAME)
+    except Exception as e:
+        st.error(f"Failed to initialize Gemini model: {e}")
+        return None
+
+def _cache_key(structured_schema, prompt) -> str:
+    return llm_cache.make_key(
+        model_name=MODEL_NAME,
+        temperature=TEMPERATURE,
+        structured_schema=structured_schema.__name__ if structured_schema else None,
+        prompt=prompt,
+    )
+
+def _serialize_response(response) -> str:
+    if isinstance(response, BaseModel):
+        return json.dumps({"schema": type(response).__name__, "json": response.model_dump_json()})
+    return json.dumps({"content": response.content})
+
+def _deserialize_response(value: str):
+    payload = json.loads(value)
+    if "schema" in payload:
+        return SCHEMAS[payload["schema"]].model_validate_json(payload["json"])
+    from langchain_core.messages import AIMessage
+    return AIMessage(content=payload["content"])
+
+def _cached_response(key: str, ttl: Optional[float] = None):
+    cached = llm_cache.get(key, ttl)
+    if cached is not None:
         try:
-            api_key = os.environ.get('GOOGLE_API_KEY') or st.secrets.get("GOOGLE_API_KEY")
-            st.session_state[model_key] = ChatGoogleGenerativeAI(model=model_name, google_api_key=api_key, temperature=0.7)
-        except Exception as e:
-            st.error(f"Failed to initialize Gemini model: {e}")
-            return None
-    model = st.session_state[model_key]
-    if structured_output_model:
-        return model.with_structured_output(structured_output_model)
-    return model
-
-def invoke_model_with_retry(model, prompt):
+            return _deserialize_response(cached)
+        except Exception:
+            pass
+    return None
+
+def invoke_model_with_retry(model, prompt, cacheable=False, cache_ttl=None, refresh=False):
+    # With refresh=True the cached response is skipped but the new one still replaces it.
+    runnable, structured_schema = _unwrap(model)
+    key = _cache_key(structured_schema, prompt) if cacheable else None
+    if key and not refresh:
+        cached = _cached_response(key, cache_ttl)
+        if cached is not None:
+            return cached
     try:
-        return model.invoke(prompt)
+        response = runnable.invoke(prompt)
     except Exception as e:
         st.warning(f"AI model call failed: {e}. Retrying...")
-        structured_schema = model.pydantic_schema if hasattr(model, 'pydantic_schema') else None
         reinitialized_model = get_gemini_model(structured_output_model=structured_schema, force_reinit=True)
         if reinitialized_model:
-            return reinitialized_model.invoke(prompt)
+            response = _unwrap(reinitialized_model)[0].invoke(prompt)
         else:
             raise e
+    if key and response is not None:
+        llm_cache.set(key, _serialize_response(response))
+    return response
+
+# --- Prompts ---
+# Static instructions always come first and the per-request input last, so
+# every prompt shares a long, stable prefix that provider-side prompt caches
+# can reuse across topics.
+
+SYSTEM_PREAMBLE = """You are an expert instructional designer powering a study companion app.
+All generated content must follow these principles:
+- Fragmentation & Simplification: break every complex topic into core, digestible sub-points.
+- Concept Linking: relate topics to the overarching subject context whenever one is given.
+- Visualization: prefer diagrams for topics with interconnected parts.
+- Exam-Oriented Approach: highlight key terms, formulas, practical examples, and likely questions.
+"""
+
+SYLLABUS_TASK = "Task: Parse the module syllabus to extract topics. Create a URL-friendly slug for each."
+
+WEB_FOLIO_TASK = "Task: Format the given content for a web page section about the topic. Use stylish and modern HTML."
+
+EXPLANATION_TASK = """Task: Generate a comprehensive, Markdown-formatted explanation of the topic.
+- Break down the topic into core sub-points.
+- Use simple analogies.
+- Include an 'Exam Prep' section with key terms, formulas, and sample questions.
+- Provide a glossary for symbols and terms.
+"""
+
+TOPIC_BUNDLE_TASK = """Task: Generate a complete study bundle for the topic.
+- explanation: a comprehensive, Markdown-formatted explanation that breaks the topic into core sub-points,
+  uses simple analogies, includes an 'Exam Prep' section with key terms, formulas, and sample questions,
+  and provides a glossary for symbols and terms.
+- quiz: a multiple-choice quiz with 3-4 questions. Provide HTML, CSS for styling, and JS for feedback.
+- map_dot: a Graphviz DOT string for a concept map of the topic.
+- mnemonics: helpful mnemonics for the key concepts.
+"""
+
+def _build_prompt(task: str, dynamic: str) -> str:
+    return f"{SYSTEM_PREAMBLE}\n{task}\nInput:\n{dynamic}"
 
 # --- File System & Content Management ---
 
+_WEB_FOLIO_SKELETON = "<html><head><link rel=\"stylesheet\" href=\"style.css\"></head><body><h1>My Web-Folio</h1><div id=\"content\"></div><script src=\"script.js\"></script></body></html>"
+
+_TEMPLATES_DIR = pathlib.Path(__file__).parent / "templates"
+_MODULE_APP_TPL = string.Template((_TEMPLATES_DIR / "module_app.py.tmpl").read_text())
+_WEB_DEV_APP_TPL = string.Template((_TEMPLATES_DIR / "web_dev_app.py.tmpl").read_text())
+
+_CTX_LOCK = threading.Lock()
+
+def _context_path(subject_name: str) -> pathlib.Path:
+    return pathlib.Path("subjects") / subject_name / "subject_context.json"
+
+def _atomic_write_text(path: pathlib.Path, text: str):
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    # 0o666 lets the process umask apply, as it would for a plain open().
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        if path.exists():
+            os.chmod(tmp_path, stat.S_IMODE(path.stat().st_mode))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def _atomic_write_ini(path: pathlib.Path, config: configparser.ConfigParser):
+    buffer = io.StringIO()
+    config.write(buffer)
+    _atomic_write_text(path, buffer.getvalue())
+
+def migrate_ini_to_json(subject_name: str) -> bool:
+    ini_path = pathlib.Path("subjects") / subject_name / "subject_context.txt"
+    json_path = _context_path(subject_name)
+    if json_path.exists() or not ini_path.exists():
+        return False
+    config = configparser.ConfigParser()
+    config.read(ini_path)
+    ctx = {section: dict(config[section]) for section in config.sections()}
+    ctx['saved_content'] = {
+        topic: [t for t in types.split(",") if t]
+        for topic, types in ctx.get('saved_content', {}).items()
+    }
+    _atomic_write_text(json_path, json.dumps(ctx, indent=2))
+    return True
+
+@st.cache_resource(show_spinner=False)
+def _read_ctx(subject_name: str) -> Dict:
+    migrate_ini_to_json(subject_name)
+    context_path = _context_path(subject_name)
+    if context_path.exists():
+        return json.loads(context_path.read_text())
+    return {}
+
+def _flush_ctx(subject_name: str):
+    _atomic_write_text(_context_path(subject_name), json.dumps(_read_ctx(subject_name), indent=2))
+
 def initialize_subject(subject_name: str):
     subject_dir = pathlib.Path("subjects") / subject_name
     subject_dir.mkdir(parents=True, exist_ok=True)
 
-    subject_context_path = subject_dir / "subject_context.txt"
-    if not subject_context_path.exists():
-        config = configparser.ConfigParser()
-        config['subject'] = {'name': subject_name, 'context': f'The study of {subject_name}.'}
-        config['cross_module_concepts'] = {'concept1': 'Description1'}
-        config['saved_content'] = {}
-        with open(subject_context_path, "w") as f:
-            config.write(f)
+    with _CTX_LOCK:
+        ctx = _read_ctx(subject_name)
+        if not ctx:
+            ctx['subject'] = {'name': subject_name, 'context': f'The study of {subject_name}.'}
+            ctx['cross_module_concepts'] = {'concept1': 'Description1'}
+            ctx['saved_content'] = {}
+            _flush_ctx(subject_name)
 
     # Create web-folio files
     if not (subject_dir / "index.html").exists():
-        (subject_dir / "index.html").write_text("<html><head><link rel=\"stylesheet\" href=\"style.css\"></head><body><h1>My Web-Folio</h1><div id=\"content\"></div><script src=\"script.js\"></script></body></html>")
+        (subject_dir / "index.html").write_text(_WEB_FOLIO_SKELETON)
     if not (subject_dir / "style.css").exists():
         (subject_dir / "style.css").write_text("body { font-family: sans-serif; }")
     if not (subject_dir / "script.js").exists():
         (subject_dir / "script.js").write_text("console.log('Web-Folio loaded');")
     
     create_web_dev_app(subject_name)
+    _load_subject_structure.clear()
 
 def create_web_dev_app(subject_name: str):
     subject_dir = pathlib.Path("subjects") / subject_name
     web_dev_app_path = subject_dir / f"{subject_name}_web_dev.py"
 
-    app_template = f"""
-import streamlit as st
-import pathlib
-
-st.set_page_config(page_title=f"{subject_name} Web Dev")
-st.title("Web-Folio Editor")
-
-subject_dir = pathlib.Path(__file__).parent
-index_path = subject_dir / "index.html"
-
-if index_path.exists():
-    html_content = index_path.read_text()
-    edited_html = st.text_area("HTML Content", html_content, height=500)
-
-    if st.button("Save Changes"):
-        index_path.write_text(edited_html)
-        st.success("Changes saved!")
-"""
-    web_dev_app_path.write_text(app_template)
+    web_dev_app_path.write_text(_WEB_DEV_APP_TPL.substitute(subject_name=repr(subject_name)))
 
-def initialize_module(subject_name: str, module_name: str, syllabus_text: str):
+def initialize_module(subject_name: str, module_name: str, syllabus_text: str) -> Optional[Dict[str, str]]:
     initialize_subject(subject_name)
     module_dir = pathlib.Path("subjects") / subject_name / module_name
     module_dir.mkdir(parents=True, exist_ok=True)
 
     llm_for_topics = get_gemini_model(ModuleTopics)
-    prompt = f"Parse the syllabus for '{module_name}' to extract topics. Create a URL-friendly slug for each. Syllabus: {syllabus_text}"
-    if llm_for_topics:
-        response = invoke_model_with_retry(llm_for_topics, prompt)
-        if isinstance(response, ModuleTopics):
-            config = configparser.ConfigParser()
-            config['module'] = {'name': module_name, 'context': 'Initial context.'}
-            config['topics'] = {topic.slug: topic.name for topic in response.topics}
-            config['features'] = {
-                'conceptual_breakdown': 'true',
-                'visual_concept_map': 'true',
-                'interactive_quiz': 'true',
-                'mnemonics': 'true'
-            }
-            with open(module_dir / "module_context.txt", "w") as f:
-                config.write(f)
-        else:
-            st.error("Failed to parse syllabus.")
-            return
-
-    app_template = f"""
-import streamlit as st
-import pathlib
-import configparser
-import sys
-sys.path.append(str(pathlib.Path(__file__).resolve().parents[3]))
-import mcp_study
-st.set_page_config(page_title="{module_name}", layout="wide")
-st.title("{module_name}")
-
-module_path = pathlib.Path(__file__).parent
-subject_name = module_path.parent.name
-config = configparser.ConfigParser()
-config.read(module_path / "module_context.txt")
-
-topics = dict(config['topics']) if 'topics' in config else {{}}
-features = dict(config['features']) if 'features' in config else {{}}
-
-selected_topic_slug = st.sidebar.radio("Select Topic", list(topics.keys()), format_func=lambda slug: topics[slug])
-
-if selected_topic_slug:
-    topic_name = topics[selected_topic_slug]
-    st.header(topic_name)
-
-    if 'generated_content' not in st.session_state:
-        st.session_state.generated_content = {{}}
-
-    if features.get('conceptual_breakdown') == 'true':
-        if st.button("Conceptual Breakdown"):
-            with st.spinner("Generating explanation..."):
-                explanation = mcp_study.generate_topic_explanation(topic_name, "", "")
-                st.session_state.generated_content['explanation'] = explanation
-                st.markdown(explanation)
-        if 'explanation' in st.session_state.generated_content and st.session_state.generated_content['explanation']:
-            if st.button("Save Explanation to Web-Folio"):
-                mcp_study.update_web_folio(subject_name, topic_name, st.session_state.generated_content['explanation'], "markdown")
-                st.success("Explanation saved to Web-Folio!")
-
-    if features.get('visual_concept_map') == 'true':
-        if st.button("Visual Concept Map"):
-            with st.spinner("Generating map..."):
-                dot_string = mcp_study.generate_visual_map(topic_name)
-                st.session_state.generated_content['map'] = dot_string
-                st.graphviz_chart(dot_string)
-        if 'map' in st.session_state.generated_content and st.session_state.generated_content['map']:
-            if st.button("Save Map to Web-Folio"):
-                mcp_study.update_web_folio(subject_name, topic_name, st.session_state.generated_content['map'], "graphviz")
-                st.success("Map saved to Web-Folio!")
-
-    if features.get('interactive_quiz') == 'true':
-        if st.button("Interactive Quiz"):
-            with st.spinner("Generating quiz..."):
-                code = mcp_study.generate_interactive_quiz(topic_name)
-                st.session_state.generated_content['quiz'] = code
-                if code:
-                    st.components.v1.html(f'<style>{"code.css"}</style>{"code.html"}', height=500)
-        if 'quiz' in st.session_state.generated_content and st.session_state.generated_content['quiz']:
-            if st.button("Save Quiz to Web-Folio"):
-                mcp_study.update_web_folio(subject_name, topic_name, st.session_state.generated_content['quiz'].html, "html")
-                st.success("Quiz saved to Web-Folio!")
-
-    if features.get('mnemonics') == 'true':
-        if st.button("Generate Mnemonics"):
-            with st.spinner("Generating mnemonics..."):
-                mnemonics = mcp_study.generate_mnemonics(topic_name)
-                st.session_state.generated_content['mnemonics'] = mnemonics
-                st.markdown(mnemonics)
-        if 'mnemonics' in st.session_state.generated_content and st.session_state.generated_content['mnemonics']:
-            if st.button("Save Mnemonics to Web-Folio"):
-                mcp_study.update_web_folio(subject_name, topic_name, st.session_state.generated_content['mnemonics'], "markdown")
-                st.success("Mnemonics saved to Web-Folio!")
+    if not llm_for_topics:
+        return None
+    # Re-initializing a module with an unchanged syllabus is served from llm_cache.
+    prompt = _build_prompt(SYLLABUS_TASK, f"Module: {module_name}\nSyllabus: {syllabus_text}")
+    response = invoke_model_with_retry(llm_for_topics, prompt, cacheable=True)
+    if not isinstance(response, ModuleTopics):
+        st.error("Failed to parse syllabus.")
+        return None
 
-"""
-    (module_dir / f"{module_name}_app.py").write_text(app_template)
+    config = configparser.ConfigParser()
+    config['module'] = {'name': module_name, 'context': 'Initial context.'}
+    # Keep the first occurrence when the model repeats a topic name or slug. Slugs are
+    # compared the way ConfigParser stores them (lowercased), so "Intro" and "intro" collide.
+    topics = {}
+    seen_names = set()
+    for topic in response.topics:
+        slug = config.optionxform(topic.slug)
+        if slug not in topics and topic.name not in seen_names:
+            topics[slug] = topic.name
+            seen_names.add(topic.name)
+    config['topics'] = topics
+    config['features'] = {
+        'conceptual_breakdown': 'true',
+        'visual_concept_map': 'true',
+        'interactive_quiz': 'true',
+        'mnemonics': 'true'
+    }
+    _atomic_write_ini(module_dir / "module_context.txt", config)
+
+    (module_dir / f"{module_name}_app.py").write_text(
+        _MODULE_APP_TPL.substitute(subject_name=repr(subject_name), module_name=repr(module_name))
+    )
     (module_dir / "syllabus.txt").write_text(syllabus_text)
+    _load_subject_structure.clear()
     st.success(f"Module '{module_name}' initialized.")
-
-def update_web_folio(subject_name: str, topic_name: str, content: str, content_type: str):
+    return topics
+
+def _render_web_folio_html(topic_name: str, content: str, content_type: str, pretty: bool = False) -> str:
+    if pretty:
+        prompt = _build_prompt(WEB_FOLIO_TASK, f"Topic: {topic_name}\nContent type: {content_type}\nContent: {content}")
+        pretty_html = _generate_text(prompt, cacheable=True)
+        if pretty_html is not None:
+            return pretty_html
+    if content_type == "markdown":
+        import markdown
+        return markdown.markdown(content, extensions=["fenced_code", "tables"])
+    if content_type == "graphviz":
+        import graphviz
+        try:
+            svg = graphviz.Source(content).pipe(format="svg").decode("utf-8")
+            return svg[svg.find("<svg"):]
+        except Exception:
+            # Graphviz binaries missing or invalid DOT: keep the source visible.
+            return f"<pre>{html.escape(content)}</pre>"
+    return content
+
+def update_web_folio(subject_name: str, topic_name: str, content: str, content_type: str, pretty: bool = False):
     subject_dir = pathlib.Path("subjects") / subject_name
     index_path = subject_dir / "index.html"
-    context_path = subject_dir / "subject_context.txt"
 
-    model = get_gemini_model()
-    prompt = f"Format the following {content_type} content for a web page section about '{topic_name}'. Use stylish and modern HTML. Content: {content}"
-    if model:
-        response = invoke_model_with_retry(model, prompt)
-        html_content = response.content
+    html_content = _render_web_folio_html(topic_name, content, content_type, pretty)
+    if index_path.exists():
+        from lxml import etree, html as lh
+        # Decode explicitly: libxml2 falls back to Latin-1 for files without a <meta charset>.
+        try:
+            doc = lh.document_fromstring(index_path.read_text(encoding="utf-8")).getroottree()
+        except etree.ParserError:
+            # An empty index.html (e.g. cleared in the Web-Folio Editor) starts over from the skeleton.
+            doc = lh.document_fromstring(_WEB_FOLIO_SKELETON).getroottree()
+        content_divs = doc.xpath('//div[@id="content"]')
+        if content_divs:
+            content_div = content_divs[0]
+            # Re-saving the same item replaces its section instead of duplicating it.
+            for stale in content_div.xpath('./section[@data-topic=$topic and @data-type=$type]', topic=topic_name, type=content_type):
+                content_div.remove(stale)
+            section = lh.fragment_fromstring(html_content, create_parent="section")
+            section.set("data-topic", topic_name)
+            section.set("data-type", content_type)
+            content_div.insert(0, section)
+            _atomic_write_text(index_path, lh.tostring(doc, encoding="unicode", method="html", doctype="<!DOCTYPE html>"))
+
+    with _CTX_LOCK:
+        saved_types = _read_ctx(subject_name).setdefault('saved_content', {}).setdefault(topic_name, [])
+        if content_type not in saved_types:
+            saved_types.append(content_type)
+            _flush_ctx(subject_name)
+
+def _subjects_fingerprint(base_path: str) -> tuple:
+    base_dir = pathlib.Path(base_path)
+    if not base_dir.exists():
+        return ()
+    return tuple(sorted((p.name, p.stat().st_mtime_ns) for p in base_dir.iterdir()))
 
-        if index_path.exists():
-            existing_html = index_path.read_text()
-            new_html = existing_html.replace("<div id=\"content\">", f"<div id=\"content\">\n{html_content}")
-            index_path.write_text(new_html)
-    
-    config = configparser.ConfigParser()
-    config.read(context_path)
-    if not config.has_section('saved_content'):
-        config.add_section('saved_content')
-    
-    saved_types = config.get('saved_content', topic_name, fallback="")
-    if content_type not in saved_types:
-        new_types = saved_types + ("," if saved_types else "") + content_type
-        config.set('saved_content', topic_name, new_types)
+def load_subject_structure(base_path: str = "subjects") -> Dict:
+    return _load_subject_structure(base_path, _subjects_fingerprint(base_path))
 
-    with open(context_path, "w") as f:
-        config.write(f)
+def _parse_module_ctx(pair) -> Dict:
+    subject_name, module_dir = pair
+    config = configparser.ConfigParser()
+    config.read(module_dir / "module_context.txt")
+    topics = dict(config['topics']) if 'topics' in config else {}
+    return {"subject": subject_name, "module": module_dir.name, "topics": topics}
 
-def load_subject_structure(base_path: str = "subjects") -> Dict:
+@st.cache_data(ttl=60, show_spinner=False)
+def _load_subject_structure(base_path: str, fingerprint: tuple) -> Dict:
     structure = {}
     base_dir = pathlib.Path(base_path)
     if not base_dir.exists():
@@ -243,62 +377,123 @@ def load_subject_structure(base_path: str = "subjects") -> Dict:
         if subject_dir.is_dir():
             subject_name = subject_dir.name
             structure[subject_name] = {"modules": {}, "context": ""}
-            subject_context_path = subject_dir / "subject_context.txt"
-            if subject_context_path.exists():
-                config = configparser.ConfigParser()
-                config.read(subject_context_path)
-                if 'subject' in config and 'context' in config['subject']:
-                    structure[subject_name]['context'] = config['subject']['context']
-            for module_dir in subject_dir.iterdir():
-                if module_dir.is_dir():
-                    module_name = module_dir.name
-                    module_context_path = module_dir / "module_context.txt"
-                    if module_context_path.exists():
-                        config = configparser.ConfigParser()
-                        config.read(module_context_path)
-                        topics = dict(config['topics']) if 'topics' in config else {{}}
-                        structure[subject_name]["modules"][module_name] = {"topics": topics}
+            structure[subject_name]['context'] = _read_ctx(subject_name).get('subject', {}).get('context', "")
+    module_dirs = [
+        (context_path.parent.parent.name, context_path.parent)
+        for context_path in base_dir.glob("*/*/module_context.txt")
+    ]
+    if module_dirs:
+        with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+            for parsed in executor.map(_parse_module_ctx, module_dirs, chunksize=4):
+                structure[parsed["subject"]]["modules"][parsed["module"]] = {"topics": parsed["topics"]}
     return structure
 
 # --- Pedagogical LLM Functions ---
 
-def generate_topic_explanation(topic_name: str, module_context: str, subject_context: str) -> str:
-    model = get_gemini_model()
-    prompt = f"""
-    Generate a comprehensive, Markdown-formatted explanation for '{topic_name}'.
-    - Break down the topic into core sub-points.
-    - Use simple analogies.
-    - Include an 'Exam Prep' section with key terms, formulas, and sample questions.
-    - Provide a glossary for symbols and terms.
-    """
-    if model:
-        response = invoke_model_with_retry(model, prompt)
-        return response.content
-    return "Error: AI model not available."
+_DOT_RE = re.compile(r"```dot\s*(.*?)```", re.DOTALL)
+_MODEL_UNAVAILABLE = "Error: AI model not available."
 
-def generate_visual_map(topic_context: str) -> str:
+def _generate_text(prompt: str, cacheable: bool = False) -> Optional[str]:
     model = get_gemini_model()
-    prompt = f"Generate a Graphviz DOT string for a concept map on: {topic_context}."
     if model:
-        response = invoke_model_with_retry(model, prompt)
-        dot_match = re.search(r"```dot(.*)```", response.content, re.DOTALL)
-        if dot_match:
-            return dot_match.group(1).strip()
-    return 'digraph G { error[label="Failed to generate map"]; }'
+        return invoke_model_with_retry(model, prompt, cacheable=cacheable).content
+    return None
 
-def generate_interactive_quiz(topic_name: str) -> Optional[GeneratedCode]:
-    structured_llm = get_gemini_model(GeneratedCode)
-    prompt = f"Create a multiple-choice quiz with 3-4 questions for '{topic_name}'. Provide HTML, CSS for styling, and JS for feedback."
+def _extract_dot(text: str) -> str:
+    dot_match = _DOT_RE.search(text)
+    return dot_match.group(1).strip() if dot_match else text.strip()
+
+def _clean_bundle(bundle: Optional[TopicBundle]) -> Optional[TopicBundle]:
+    if bundle is not None:
+        bundle.map_dot = _extract_dot(bundle.map_dot)
+    return bundle
+
+def _generate_structured(schema, prompt: str, cacheable: bool = False, cache_ttl: Optional[float] = None,
+                         refresh: bool = False):
+    structured_llm = get_gemini_model(schema)
     if structured_llm:
-        response = invoke_model_with_retry(structured_llm, prompt)
-        if isinstance(response, GeneratedCode):
+        response = invoke_model_with_retry(structured_llm, prompt, cacheable=cacheable, cache_ttl=cache_ttl, refresh=refresh)
+        if isinstance(response, schema):
             return response
     return None
 
-def generate_mnemonics(topic_name: str) -> str:
+def _explanation_prompt(topic_name: str, module_context: str, subject_context: str) -> str:
+    return _build_prompt(
+        EXPLANATION_TASK,
+        f"Topic: {topic_name}\nModule context: {module_context}\nSubject context: {subject_context}",
+    )
+
+def generate_topic_explanation_stream(topic_name: str, module_context: str, subject_context: str,
+                                     status: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+    # Errors are streamed as text, so callers pass `status` to learn whether the output is usable.
+    status = {} if status is None else status
+    status['ok'] = False
     model = get_gemini_model()
-    prompt = f"Generate helpful mnemonics for the key concepts in '{topic_name}'."
-    if model:
-        response = invoke_model_with_retry(model, prompt)
-        return response.content
-    return "Error: AI model not available."
+    prompt = _explanation_prompt(topic_name, module_context, subject_context)
+    for attempt in range(2):
+        if attempt:
+            model = get_gemini_model(force_reinit=True)
+        if not model:
+            yield _MODEL_UNAVAILABLE
+            return
+        started = False
+        try:
+            for chunk in model.stream(prompt):
+                started = True
+                yield chunk.content
+            status['ok'] = True
+            return
+        except Exception as e:
+            # Only retry when nothing has been shown yet; otherwise end the stream with the error.
+            if started or attempt:
+                yield f"\n\nError: AI model call failed: {e}"
+                return
+            st.warning(f"AI model call failed: {e}. Retrying...")
+
+def _topic_bundle_prompt(topic_name: str, subject_context: str) -> str:
+    return _build_prompt(TOPIC_BUNDLE_TASK, f"Topic: {topic_name}\nSubject context: {subject_context}")
+
+def generate_topic_bundle(topic_name: str, subject_context: str = "", refresh: bool = False) -> Optional[TopicBundle]:
+    prompt = _topic_bundle_prompt(topic_name, subject_context)
+    return _clean_bundle(_generate_structured(TopicBundle, prompt, cacheable=True, cache_ttl=BUNDLE_CACHE_TTL, refresh=refresh))
+
+def generate_topic_bundles(topic_names: List[str], subject_context: str = "", refresh: bool = False) -> List[Optional[TopicBundle]]:
+    structured_llm = get_gemini_model(TopicBundle)
+    if not structured_llm:
+        return [None] * len(topic_names)
+    prompts = [_topic_bundle_prompt(topic_name, subject_context) for topic_name in topic_names]
+    keys = [_cache_key(TopicBundle, prompt) for prompt in prompts]
+    responses = [None if refresh else _cached_response(key, BUNDLE_CACHE_TTL) for key in keys]
+    missing = [i for i, response in enumerate(responses) if response is None]
+    if missing:
+        fresh = structured_llm.runnable.batch([prompts[i] for i in missing], config={"max_concurrency": 8}, return_exceptions=True)
+        for i, response in zip(missing, fresh):
+            responses[i] = response
+            if isinstance(response, TopicBundle):
+                llm_cache.set(keys[i], _serialize_response(response))
+    bundles = [_clean_bundle(response) if isinstance(response, TopicBundle) else None for response in responses]
+    failures = [response for response in responses if not isinstance(response, TopicBundle)]
+    if failures:
+        errors = [response for response in failures if isinstance(response, Exception)]
+        detail = f" First error: {errors[0]}" if errors else ""
+        st.error(f"Failed to generate study material for {len(failures)} of {len(topic_names)} topics.{detail}")
+    return bundles
+
+# Single-item helpers kept for launchers generated before the bundle API; they share its cache.
+
+def generate_topic_explanation(topic_name: str, module_context: str, subject_context: str) -> str:
+    return "".join(generate_topic_explanation_stream(topic_name, module_context, subject_context))
+
+def generate_visual_map(topic_context: str) -> str:
+    bundle = generate_topic_bundle(topic_context)
+    if bundle and bundle.map_dot:
+        return bundle.map_dot
+    return 'digraph G { error[label="Failed to generate map"]; }'
+
+def generate_interactive_quiz(topic_name: str) -> Optional[GeneratedCode]:
+    bundle = generate_topic_bundle(topic_name)
+    return bundle.quiz if bundle else None
+
+def generate_mnemonics(topic_name: str) -> str:
+    bundle = generate_topic_bundle(topic_name)
+    return bundle.mnemonics if bundle else _MODEL_UNAVAILABLE
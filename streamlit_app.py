@@ -1,13 +1,12 @@
 import streamlit as st
 import mcp_study
 import pathlib
-import subprocess
+import configparser
 
 def main():
     st.set_page_config(page_title="Dynamic AI Study Companion", layout="wide")
 
-    if 'subject_structure' not in st.session_state:
-        st.session_state.subject_structure = mcp_study.load_subject_structure()
+    st.session_state.subject_structure = mcp_study.load_subject_structure()
 
     if not st.session_state.subject_structure:
         display_setup_wizard()
@@ -23,32 +22,19 @@ def display_setup_wizard():
         submitted = st.form_submit_button("Initialize Module")
 
         if submitted and subject_name and module_name and syllabus_text:
-            mcp_study.initialize_module(subject_name, module_name, syllabus_text)
-            st.session_state.subject_structure = mcp_study.load_subject_structure()
-            st.rerun()
+            # Switching from the wizard to the Study Hub needs a rerun.
+            if mcp_study.initialize_module(subject_name, module_name, syllabus_text) is not None:
+                st.rerun()
 
 def display_study_hub():
     st.sidebar.title("🎓 Study Hub")
     
     subjects = list(st.session_state.subject_structure.keys())
     selected_subject = st.sidebar.selectbox("Select Subject", subjects)
+    selected_module = None
+    view = "Study"
 
-    if selected_subject:
-        st.sidebar.markdown("---")
-        if st.sidebar.button("🚀 Launch Web Dev App"):
-            launch_web_dev_app(selected_subject)
-
-        modules = list(st.session_state.subject_structure[selected_subject]["modules"].keys())
-        if modules:
-            selected_module = st.sidebar.selectbox("Select Module", modules)
-            
-            if selected_module:
-                st.sidebar.markdown("---")
-                if st.sidebar.button(f"🚀 Launch {selected_module} App"):
-                    launch_module_app(selected_subject, selected_module)
-        else:
-            st.warning("No modules found. Add a new module below.")
-
+    # Handled before the module picker renders, so a new module appears without st.rerun().
     with st.sidebar.expander("Add New Module"):
         with st.form("new_module_form"):
             new_module_subject = st.selectbox("Subject", subjects, index=subjects.index(selected_subject) if selected_subject in subjects else 0)
@@ -56,36 +42,142 @@ def display_study_hub():
             new_syllabus = st.text_area("Syllabus for New Module")
             if st.form_submit_button("Create New Module"):
                 if new_module_name and new_syllabus:
-                    mcp_study.initialize_module(new_module_subject, new_module_name, new_syllabus)
-                    st.session_state.subject_structure = mcp_study.load_subject_structure()
-                    st.rerun()
+                    topics = mcp_study.initialize_module(new_module_subject, new_module_name, new_syllabus)
+                    if topics is not None:
+                        st.session_state.subject_structure[new_module_subject]["modules"][new_module_name] = {"topics": topics}
                 else:
                     st.error("Please provide a name and syllabus for the new module.")
 
-    st.markdown("## Welcome to the Dynamic AI Study Companion!")
-    st.markdown("Select a subject and module from the sidebar to launch a dedicated learning app.")
-
-def launch_module_app(subject_name, module_name):
-    app_path = pathlib.Path("subjects") / subject_name / module_name / f"{module_name}_app.py"
-    if app_path.exists():
-        try:
-            subprocess.Popen(["streamlit", "run", str(app_path)])
-            st.success(f"Launching {module_name} app in a new tab...")
-        except Exception as e:
-            st.error(f"Failed to launch module app: {e}")
+    if selected_subject:
+        st.sidebar.markdown("---")
+        view = st.sidebar.radio("View", ["Study", "Web-Folio Editor"], horizontal=True)
+
+        modules = list(st.session_state.subject_structure[selected_subject]["modules"].keys())
+        if modules:
+            selected_module = st.sidebar.selectbox("Select Module", modules)
+        else:
+            st.warning("No modules found. Add a new module in the sidebar.")
+
+    if selected_subject and view == "Web-Folio Editor":
+        display_web_dev_view(selected_subject)
+    elif selected_subject and selected_module:
+        display_module_view(selected_subject, selected_module)
     else:
-        st.error(f"Module app not found at: {app_path}")
-
-def launch_web_dev_app(subject_name):
-    app_path = pathlib.Path("subjects") / subject_name / f"{subject_name}_web_dev.py"
-    if app_path.exists():
-        try:
-            subprocess.Popen(["streamlit", "run", str(app_path)])
-            st.success(f"Launching {subject_name} web dev app in a new tab...")
-        except Exception as e:
-            st.error(f"Failed to launch web dev app: {e}")
+        st.markdown("## Welcome to the Dynamic AI Study Companion!")
+        st.markdown("Select a subject and module from the sidebar to start studying.")
+
+def display_module_view(subject_name, module_name):
+    module_path = pathlib.Path("subjects") / subject_name / module_name
+    config = configparser.ConfigParser()
+    config.read(module_path / "module_context.txt")
+
+    topics = dict(config['topics']) if 'topics' in config else {}
+    features = dict(config['features']) if 'features' in config else {}
+    module_context = config.get('module', 'context', fallback="")
+    subject_context = mcp_study.load_subject_structure().get(subject_name, {}).get("context", "")
+
+    st.title(module_name)
+    selected_topic_slug = st.sidebar.radio("Select Topic", list(topics.keys()), format_func=lambda slug: topics[slug])
+
+    if 'bundles' not in st.session_state:
+        st.session_state.bundles = {}
+    if 'explanations' not in st.session_state:
+        st.session_state.explanations = {}
+
+    if st.sidebar.button("Generate All Topics"):
+        with st.spinner("Generating study material for all topics..."):
+            slugs = list(topics.keys())
+            bundles = mcp_study.generate_topic_bundles([topics[slug] for slug in slugs], subject_context)
+            st.session_state.bundles.update(((subject_name, module_name, slug), bundle) for slug, bundle in zip(slugs, bundles))
+
+    if not selected_topic_slug:
+        return
+
+    topic_name = topics[selected_topic_slug]
+    bundle_key = (subject_name, module_name, selected_topic_slug)
+    st.header(topic_name)
+
+    def get_bundle(refresh=False):
+        if refresh or st.session_state.bundles.get(bundle_key) is None:
+            with st.spinner("Generating study material..."):
+                st.session_state.bundles[bundle_key] = mcp_study.generate_topic_bundle(topic_name, subject_context, refresh=refresh)
+            if st.session_state.bundles[bundle_key] is None:
+                st.error(f"Failed to generate study material for '{topic_name}'.")
+        return st.session_state.bundles[bundle_key]
+
+    # Bypasses the response cache so a poor or outdated answer can be replaced.
+    if st.button("Regenerate Topic"):
+        st.session_state.explanations.pop(bundle_key, None)
+        get_bundle(refresh=True)
+
+    bundle = st.session_state.bundles.get(bundle_key)
+
+    if features.get('conceptual_breakdown') == 'true':
+        # A streamed explanation was asked for explicitly, so it wins over the bundle's.
+        streamed = st.session_state.explanations.get(bundle_key)
+        if st.button("Conceptual Breakdown"):
+            if streamed:
+                st.markdown(streamed)
+            elif bundle:
+                st.markdown(bundle.explanation)
+            else:
+                status = {}
+                text = st.write_stream(
+                    mcp_study.generate_topic_explanation_stream(topic_name, module_context, subject_context, status)
+                )
+                # Keep failed output on screen only; storing it would make the error saveable.
+                if status['ok']:
+                    streamed = st.session_state.explanations[bundle_key] = text
+        explanation = streamed or (bundle.explanation if bundle else None)
+        if explanation:
+            if st.button("Save Explanation to Web-Folio"):
+                mcp_study.update_web_folio(subject_name, topic_name, explanation, "markdown")
+                st.success("Explanation saved to Web-Folio!")
+
+    if features.get('visual_concept_map') == 'true':
+        if st.button("Visual Concept Map"):
+            bundle = get_bundle()
+            if bundle:
+                st.graphviz_chart(bundle.map_dot)
+        if bundle and bundle.map_dot:
+            if st.button("Save Map to Web-Folio"):
+                mcp_study.update_web_folio(subject_name, topic_name, bundle.map_dot, "graphviz")
+                st.success("Map saved to Web-Folio!")
+
+    if features.get('interactive_quiz') == 'true':
+        if st.button("Interactive Quiz"):
+            bundle = get_bundle()
+            if bundle:
+                code = bundle.quiz
+                st.components.v1.html(f'<style>{code.css}</style>{code.html}<script>{code.javascript}</script>', height=500)
+        if bundle and bundle.quiz:
+            if st.button("Save Quiz to Web-Folio"):
+                mcp_study.update_web_folio(subject_name, topic_name, bundle.quiz.html, "html")
+                st.success("Quiz saved to Web-Folio!")
+
+    if features.get('mnemonics') == 'true':
+        if st.button("Generate Mnemonics"):
+            bundle = get_bundle()
+            if bundle:
+                st.markdown(bundle.mnemonics)
+        if bundle and bundle.mnemonics:
+            if st.button("Save Mnemonics to Web-Folio"):
+                mcp_study.update_web_folio(subject_name, topic_name, bundle.mnemonics, "markdown")
+                st.success("Mnemonics saved to Web-Folio!")
+
+def display_web_dev_view(subject_name):
+    st.title("Web-Folio Editor")
+    index_path = pathlib.Path("subjects") / subject_name / "index.html"
+
+    if index_path.exists():
+        html_content = index_path.read_text(encoding="utf-8")
+        edited_html = st.text_area("HTML Content", html_content, height=500)
+
+        if st.button("Save Changes"):
+            index_path.write_text(edited_html, encoding="utf-8")
+            st.success("Changes saved!")
     else:
-        st.error(f"Web dev app not found at: {app_path}")
+        st.error(f"Web-folio not found at: {index_path}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file